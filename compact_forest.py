@@ -0,0 +1,72 @@
+import copy
+import pickle
+import time
+import numpy as np
+from sklearn.base import clone
+from evaluation import evaluate_model
+
+# Tree shapes tried when refitting the forest; depth None with one sample per leaf is the untuned original
+COMPACT_DEPTHS = (None, 16, 12, 10, 8)
+COMPACT_MIN_SAMPLES_LEAF = (1, 5)
+COMPACT_TREE_COUNTS = (100, 75, 50, 25)
+
+def model_profile(model, X, y, repeats=20):
+    """Return serialized size, load time, single-row predict latency and metrics of a fitted model."""
+    payload = pickle.dumps(model)
+
+    start = time.perf_counter()
+    pickle.loads(payload)
+    load_seconds = time.perf_counter() - start
+
+    # Serving predicts one row per request
+    row = X[:1]
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.predict(row)
+        latencies.append(time.perf_counter() - start)
+
+    return {
+        "size_bytes": len(payload),
+        "load_seconds": load_seconds,
+        "predict_ms": float(np.median(latencies) * 1000),
+        **evaluate_model(y, model.predict(X)),
+    }
+
+def _first_trees(model, n_trees):
+    """Copy of a fitted forest keeping only its first n_trees estimators."""
+    compact = copy.copy(model)
+    compact.estimators_ = model.estimators_[:n_trees]
+    compact.n_estimators = n_trees
+    return compact
+
+def compact_random_forest(model_rf, X_train, y_train, X_val, y_val, max_rmse_increase=0.01):
+    """
+    Return the smallest forest whose held-out RMSE is within `max_rmse_increase` (relative) of the original.
+    Candidates refit the forest with bounded depth and larger leaves, then drop trees; the RMSE of every
+    tree count is computed from cached per-tree predictions so dropping trees needs no extra predict calls.
+    """
+    baseline_rmse = evaluate_model(y_val, model_rf.predict(X_val))["rmse"]
+    budget = baseline_rmse * (1 + max_rmse_increase)
+
+    best, best_size = model_rf, len(pickle.dumps(model_rf))
+    for max_depth in COMPACT_DEPTHS:
+        for min_samples_leaf in COMPACT_MIN_SAMPLES_LEAF:
+            if max_depth is None and min_samples_leaf == 1:
+                candidate = model_rf
+            else:
+                candidate = clone(model_rf).set_params(max_depth=max_depth, min_samples_leaf=min_samples_leaf)
+                candidate.fit(X_train, y_train)
+
+            n_estimators = len(candidate.estimators_)
+            tree_predictions = np.cumsum([tree.predict(X_val) for tree in candidate.estimators_], axis=0)
+            for n_trees in {n_estimators, *(n for n in COMPACT_TREE_COUNTS if n < n_estimators)}:
+                rmse = evaluate_model(y_val, tree_predictions[n_trees - 1] / n_trees)["rmse"]
+                if rmse > budget:
+                    continue
+                compact = _first_trees(candidate, n_trees)
+                size = len(pickle.dumps(compact))
+                if size < best_size:
+                    best, best_size = compact, size
+
+    return best
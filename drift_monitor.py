@@ -0,0 +1,208 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import numpy as np
+
+# Inference inputs and outputs tracked for drift
+MONITORED_FEATURES = ['Temperature', 'Fuel_Price', 'CPI', 'Unemployment', 'ensemble_prediction']
+
+# Training column used as the baseline distribution of each monitored feature
+BASELINE_COLUMNS = {
+    'Temperature': 'Temperature',
+    'Fuel_Price': 'Fuel_Price',
+    'CPI': 'CPI',
+    'Unemployment': 'Unemployment',
+    'ensemble_prediction': 'Weekly_Sales',
+}
+
+def _histogram(values, bins):
+    """Return interior quantile edges and bin proportions of a baseline sample."""
+    edges = np.unique(np.quantile(values, np.linspace(0, 1, bins + 1)[1:-1]))
+    counts = np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1)
+    return {"edges": edges.tolist(), "proportions": (counts / counts.sum()).tolist()}
+
+def build_baseline(data, bins=10):
+    """Build the drift baseline (overall and per store) from the training rows of the sales data."""
+    def snapshot(rows):
+        return {
+            feature: {
+                "mean": float(rows[column].mean()),
+                "std": float(rows[column].std(ddof=0)),
+                **_histogram(rows[column].to_numpy(dtype=float), bins),
+            }
+            for feature, column in BASELINE_COLUMNS.items()
+        }
+
+    return {
+        "overall": snapshot(data),
+        "stores": {str(store): snapshot(rows) for store, rows in data.groupby('Store')},
+    }
+
+def population_stability_index(expected, actual, epsilon=1e-4):
+    """PSI between baseline and observed bin proportions; above 0.2 is usually treated as significant drift."""
+    expected = np.clip(np.asarray(expected, dtype=float), epsilon, None)
+    actual = np.clip(np.asarray(actual, dtype=float), epsilon, None)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+class RunningStats:
+    """Welford mean/variance and a fixed-bin histogram of one feature, updated in O(1) per value."""
+
+    def __init__(self, edges=None):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.edges = edges
+        self.bin_counts = [0] * (len(edges) + 1) if edges is not None else None
+
+    def update(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.edges is not None:
+            self.bin_counts[int(np.searchsorted(self.edges, value, side='right'))] += 1
+
+    def rebin(self, edges):
+        """Restart the histogram on new bin edges; the running mean and variance are kept."""
+        self.edges = edges
+        self.bin_counts = [0] * (len(edges) + 1) if edges is not None else None
+
+    @property
+    def variance(self):
+        return self.m2 / self.count if self.count else 0.0
+
+    def to_dict(self):
+        return {"count": self.count, "mean": self.mean, "m2": self.m2, "edges": self.edges, "bin_counts": self.bin_counts}
+
+    @classmethod
+    def from_dict(cls, state):
+        stats = cls(state["edges"])
+        stats.count, stats.mean, stats.m2 = state["count"], state["mean"], state["m2"]
+        if state["bin_counts"] is not None:
+            stats.bin_counts = state["bin_counts"]
+        return stats
+
+class DriftMonitor:
+    """
+    In-process per-store running statistics of inference inputs and predictions.
+    Drift scores against the training baseline are computed on demand, and the running state is
+    checkpointed to disk every `checkpoint_every` updates or `checkpoint_seconds`, whichever comes first.
+    """
+
+    def __init__(self, baseline=None, checkpoint_path=None, checkpoint_every=100, checkpoint_seconds=300):
+        self.baseline = baseline
+        self.baseline_fingerprint = (
+            hashlib.sha256(json.dumps(baseline, sort_keys=True).encode()).hexdigest() if baseline else None
+        )
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_seconds = checkpoint_seconds
+        self.stats = {}
+        self._pending = 0
+        self._last_checkpoint = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_files(cls, baseline_path, checkpoint_path, **kwargs):
+        """Load the training baseline and restore the running statistics from the last checkpoint, if present."""
+        baseline = None
+        if os.path.exists(baseline_path):
+            with open(baseline_path) as f:
+                baseline = json.load(f)
+        monitor = cls(baseline, checkpoint_path, **kwargs)
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as f:
+                state = json.load(f)
+            if "baseline_fingerprint" not in state:
+                # Checkpoints written before fingerprinting hold the per-store stats only
+                state = {"baseline_fingerprint": None, "stores": state}
+            monitor.stats = {
+                store: {feature: RunningStats.from_dict(s) for feature, s in features.items()}
+                for store, features in state["stores"].items()
+            }
+
+            # The baseline changed since the checkpoint (retrain, or first start without one): histograms
+            # built on the old bin edges cannot be compared with the new proportions, so restart them
+            if state["baseline_fingerprint"] != monitor.baseline_fingerprint:
+                for store, features in monitor.stats.items():
+                    baseline = monitor._store_baseline(store)
+                    for feature, stats in features.items():
+                        stats.rebin(baseline[feature]["edges"] if baseline else None)
+        return monitor
+
+    def _store_baseline(self, store):
+        if self.baseline is None:
+            return None
+        return self.baseline["stores"].get(store, self.baseline["overall"])
+
+    def _new_store_stats(self, store):
+        baseline = self._store_baseline(store)
+        return {
+            feature: RunningStats(baseline[feature]["edges"] if baseline else None)
+            for feature in MONITORED_FEATURES
+        }
+
+    def update(self, store, values):
+        """Record one inference request; `values` holds the monitored inputs and the ensemble prediction."""
+        store = str(store)
+        with self._lock:
+            if store not in self.stats:
+                self.stats[store] = self._new_store_stats(store)
+            for feature in MONITORED_FEATURES:
+                self.stats[store][feature].update(float(values[feature]))
+
+            self._pending += 1
+            if self._pending >= self.checkpoint_every or time.monotonic() - self._last_checkpoint >= self.checkpoint_seconds:
+                self._checkpoint()
+
+    def _checkpoint(self):
+        if self.checkpoint_path:
+            # Write to a temporary file first so a crash never leaves a truncated checkpoint
+            tmp_path = f"{self.checkpoint_path}.tmp"
+            try:
+                with open(tmp_path, "w") as f:
+                    json.dump({
+                        "baseline_fingerprint": self.baseline_fingerprint,
+                        "stores": {
+                            store: {feature: s.to_dict() for feature, s in features.items()}
+                            for store, features in self.stats.items()
+                        },
+                    }, f)
+                os.replace(tmp_path, self.checkpoint_path)
+            except OSError as e:
+                # Monitoring must never fail the prediction request; retry at the next interval
+                print(f"Error writing drift checkpoint: {str(e)}")
+        self._pending = 0
+        self._last_checkpoint = time.monotonic()
+
+    def checkpoint(self):
+        with self._lock:
+            self._checkpoint()
+
+    def drift_report(self, store=None):
+        """Return running statistics and PSI against the baseline for every (or one) store."""
+        with self._lock:
+            stores = [str(store)] if store is not None else sorted(self.stats, key=int)
+            report = {}
+            for store_id in stores:
+                if store_id not in self.stats:
+                    continue
+                baseline = self._store_baseline(store_id)
+                report[store_id] = {}
+                for feature, s in self.stats[store_id].items():
+                    psi = None
+                    expected = baseline[feature]["proportions"] if baseline else None
+                    if expected is not None and s.bin_counts is not None and len(s.bin_counts) == len(expected):
+                        binned = sum(s.bin_counts)
+                        if binned:
+                            psi = population_stability_index(expected, np.asarray(s.bin_counts) / binned)
+                    report[store_id][feature] = {
+                        "count": s.count,
+                        "mean": s.mean,
+                        "std": float(np.sqrt(s.variance)),
+                        "baseline_mean": baseline[feature]["mean"] if baseline else None,
+                        "psi": psi,
+                    }
+            return report
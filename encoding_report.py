@@ -0,0 +1,101 @@
+import argparse
+import time
+import pandas as pd
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import MinMaxScaler
+from xgboost import XGBRegressor
+from sklearn.ensemble import RandomForestRegressor
+import mlflow
+from features import engineer_features, matrix_nbytes, StoreEncoder, STORE_ENCODINGS
+from evaluation import evaluate_model
+
+# Compare memory, fit time and accuracy of the dense one-hot store layout against the compact encodings.
+# Use --replicas to tile the dataset with new store IDs and see how each layout scales with the number of stores.
+
+parser = argparse.ArgumentParser(description="Store encoding comparison report")
+parser.add_argument("--replicas", type=int, default=1, help="Copies of the dataset with new store IDs")
+args = parser.parse_args()
+
+# --- DATA LOADING ---
+raw = pd.read_csv("data/Walmart_Sales.csv")
+n_stores = raw['Store'].max()
+data = pd.concat(
+    [raw.assign(Store=raw['Store'] + i * n_stores) for i in range(args.replicas)],
+    ignore_index=True,
+)
+data = engineer_features(data).drop(columns=['Date'])
+
+# Same unshuffled split as train.py
+features = [col for col in data.columns if col != 'Weekly_Sales']
+X_train, X_test, y_train, y_test = train_test_split(
+    data[features], data['Weekly_Sales'], test_size=0.2, shuffle=False
+)
+
+def encode(mode):
+    """Return (XGBoost train, XGBoost test, RF train, RF test) matrices for a store encoding."""
+    if mode == "onehot":
+        # Original train.py layout: dense one-hot columns scaled with the numeric features
+        dummies = pd.get_dummies(pd.concat([X_train, X_test]), columns=['Store'], drop_first=True)
+        scaler = MinMaxScaler()
+        train = scaler.fit_transform(dummies.iloc[:len(X_train)])
+        test = scaler.transform(dummies.iloc[len(X_train):])
+        return train, test, train, test
+
+    encoder = StoreEncoder(mode).fit(X_train)
+    return (
+        encoder.transform(X_train),
+        encoder.transform(X_test),
+        encoder.transform(X_train, native=False),
+        encoder.transform(X_test, native=False),
+    )
+
+def timed_fit(model, X, y):
+    start = time.perf_counter()
+    model.fit(X, y)
+    return time.perf_counter() - start
+
+rows = []
+for mode in STORE_ENCODINGS:
+    X_train_xgb, X_test_xgb, X_train_rf, X_test_rf = encode(mode)
+
+    xgb_params = {'n_estimators': 100, 'random_state': 42}
+    if mode == "categorical":
+        xgb_params.update({'tree_method': 'hist', 'enable_categorical': True})
+    model_xgb = XGBRegressor(**xgb_params)
+    model_rf = RandomForestRegressor(n_estimators=100, random_state=42, n_jobs=-1)
+
+    xgb_fit_seconds = timed_fit(model_xgb, X_train_xgb, y_train)
+    rf_fit_seconds = timed_fit(model_rf, X_train_rf, y_train)
+
+    prediction_xgb = model_xgb.predict(X_test_xgb)
+    prediction_rf = model_rf.predict(X_test_rf)
+    final_metrics = evaluate_model(y_test, (prediction_xgb + prediction_rf) / 2)
+
+    rows.append({
+        "encoding": mode,
+        "stores": data['Store'].nunique(),
+        "xgb_train_bytes": matrix_nbytes(X_train_xgb),
+        "rf_train_bytes": matrix_nbytes(X_train_rf),
+        "xgb_fit_seconds": xgb_fit_seconds,
+        "rf_fit_seconds": rf_fit_seconds,
+        "xgb_rmse": evaluate_model(y_test, prediction_xgb)["rmse"],
+        "rf_rmse": evaluate_model(y_test, prediction_rf)["rmse"],
+        **{f"final_{metric}": value for metric, value in final_metrics.items()},
+    })
+    print(f"{mode}: {rows[-1]}")
+
+report = pd.DataFrame(rows)
+report_path = "data/encoding_report.csv"
+report.to_csv(report_path, index=False)
+print(report.to_string(index=False))
+
+# Log the report to MLflow
+mlflow.set_tracking_uri("http://127.0.0.1:5000")  # Local MLflow server
+mlflow.set_experiment("Sales Forecasting Experiment")
+
+with mlflow.start_run(run_name="Store Encoding Report"):
+    mlflow.log_param("store_replicas", args.replicas)
+    for row in rows:
+        for metric in ("xgb_train_bytes", "rf_train_bytes", "xgb_fit_seconds", "rf_fit_seconds", "final_rmse", "final_r2"):
+            mlflow.log_metric(f"{row['encoding']}_{metric}", row[metric])
+    mlflow.log_artifact(report_path, artifact_path="reports")
@@ -0,0 +1,45 @@
+import numpy as np
+from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
+
+def evaluate_model(y_true, y_pred):
+    mae = mean_absolute_error(y_true, y_pred)
+    mse = mean_squared_error(y_true, y_pred)
+    rmse = np.sqrt(mse)
+    r2 = r2_score(y_true, y_pred)
+    return {"mae": mae, "mse": mse, "rmse": rmse, "r2": r2}
+
+class StreamingMetrics:
+    """Accumulate the evaluate_model metrics chunk by chunk without keeping predictions in memory."""
+
+    def __init__(self):
+        self.count = 0
+        self.abs_error = 0.0
+        self.sq_error = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0  # Sum of squared deviations of y_true from its running mean
+
+    def update(self, y_true, y_pred):
+        if len(y_true) == 0:
+            return
+        y_true = np.asarray(y_true, dtype=float)
+        error = y_true - np.asarray(y_pred, dtype=float)
+        self.abs_error += np.abs(error).sum()
+        self.sq_error += np.square(error).sum()
+
+        # Merge the chunk mean/variance into the running totals (Chan et al. parallel update)
+        n = len(y_true)
+        chunk_mean = y_true.mean()
+        delta = chunk_mean - self.mean
+        total = self.count + n
+        self.m2 += np.square(y_true - chunk_mean).sum() + delta ** 2 * self.count * n / total
+        self.mean += delta * n / total
+        self.count = total
+
+    def result(self):
+        mse = self.sq_error / self.count
+        return {
+            "mae": self.abs_error / self.count,
+            "mse": mse,
+            "rmse": np.sqrt(mse),
+            "r2": 1 - self.sq_error / self.m2,
+        }
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.preprocessing import MinMaxScaler
+
+# Encodings supported for the Store column
+# onehot      - dense one-hot columns (original layout, one column per store)
+# sparse      - scaled numeric features plus store indicators as a CSR matrix
+# categorical - single Store column with pandas category dtype (XGBoost native support)
+STORE_ENCODINGS = ("onehot", "sparse", "categorical")
+
+# Encodings produced by StoreEncoder; the dense layout is built with pd.get_dummies in train.py
+COMPACT_STORE_ENCODINGS = ("sparse", "categorical")
+
+# Numeric model features in training column order
+NUMERIC_FEATURES = [
+    'Holiday_Flag', 'Temperature', 'Fuel_Price', 'CPI', 'Unemployment',
+    'Lag_1_Week_Sales', 'Lag_2_Week_Sales', 'DayOfWeek', 'Month', 'WeekOfYear', 'Year'
+]
+
+def engineer_features(data):
+    """Add lagged sales and date features to the raw Walmart sales data."""
+    data['Date'] = pd.to_datetime(data['Date'], format='%d-%m-%Y')
+
+    # Feature engineering
+    data['Lag_1_Week_Sales'] = data.groupby('Store')['Weekly_Sales'].shift(1)
+    data['Lag_2_Week_Sales'] = data.groupby('Store')['Weekly_Sales'].shift(2)
+    data['DayOfWeek'] = data['Date'].dt.dayofweek
+    data['Month'] = data['Date'].dt.month
+    data['WeekOfYear'] = data['Date'].dt.isocalendar().week
+    data['Year'] = data['Date'].dt.year
+
+    # Fill missing lagged sales values
+    data.bfill(inplace=True)
+
+    return data
+
+def iter_engineered_chunks(path, chunksize=100_000):
+    """
+    Stream the raw sales CSV in chunks and add the same features as engineer_features.
+    Rows must be in date order within each store; the last two weekly sales of every store are
+    carried across chunk boundaries so the lags match the in-memory pipeline.
+    """
+    first_sales, last_sales, prev_sales = {}, {}, {}
+
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        chunk['Date'] = pd.to_datetime(chunk['Date'], format='%d-%m-%Y')
+        sales = chunk.groupby('Store')['Weekly_Sales']
+        position = sales.cumcount()
+
+        # Lags inside the chunk, falling back to sales carried over from earlier chunks
+        carried_1 = chunk['Store'].map(last_sales)
+        carried_2 = chunk['Store'].map(prev_sales)
+        lag_1 = sales.shift(1).where(position >= 1, carried_1)
+        lag_2 = sales.shift(2).where(position >= 2, carried_1.where(position == 1, carried_2))
+
+        # Backfill the first weeks of a store with its first observed sales
+        for store, value in sales.first().items():
+            first_sales.setdefault(store, value)
+        store_first = chunk['Store'].map(first_sales)
+        chunk['Lag_1_Week_Sales'] = lag_1.fillna(store_first)
+        chunk['Lag_2_Week_Sales'] = lag_2.fillna(store_first)
+
+        chunk['DayOfWeek'] = chunk['Date'].dt.dayofweek
+        chunk['Month'] = chunk['Date'].dt.month
+        chunk['WeekOfYear'] = chunk['Date'].dt.isocalendar().week
+        chunk['Year'] = chunk['Date'].dt.year
+
+        # Carry the last two weekly sales of each store into the next chunk
+        for store, value in chunk['Lag_1_Week_Sales'].groupby(chunk['Store']).last().items():
+            prev_sales[store] = value
+        for store, value in sales.last().items():
+            last_sales[store] = value
+
+        yield chunk
+
+def matrix_nbytes(X):
+    """Return the memory footprint in bytes of a feature matrix."""
+    if sparse.issparse(X):
+        return X.data.nbytes + X.indices.nbytes + X.indptr.nbytes
+    if isinstance(X, pd.DataFrame):
+        return int(X.memory_usage(deep=True).sum())
+    return X.nbytes
+
+class StoreEncoder:
+    """Scale numeric features and encode the Store column without dense one-hot columns."""
+
+    def __init__(self, mode="sparse"):
+        if mode not in COMPACT_STORE_ENCODINGS:
+            raise ValueError(f"Unknown store encoding '{mode}', expected one of {COMPACT_STORE_ENCODINGS}")
+        self.mode = mode
+        self.scaler = MinMaxScaler()
+        self.stores = None
+
+    def fit(self, X):
+        """Learn the numeric feature ranges and the set of known stores."""
+        self.scaler.fit(X[NUMERIC_FEATURES])
+        self.stores = np.sort(X['Store'].unique())
+        return self
+
+    def partial_fit(self, X):
+        """Update the numeric feature ranges and known stores with a chunk of rows."""
+        self.scaler.partial_fit(X[NUMERIC_FEATURES])
+        chunk_stores = X['Store'].unique()
+        self.stores = np.sort(chunk_stores) if self.stores is None else np.union1d(self.stores, chunk_stores)
+        return self
+
+    def _store_codes(self, X):
+        # Unseen stores map to -1 (no indicator set / missing category)
+        return pd.Index(self.stores).get_indexer(X['Store'])
+
+    def transform(self, X, native=True):
+        """
+        Encode a DataFrame with a Store column and the numeric features.
+        With mode 'categorical' and native=True a DataFrame with a category Store column is
+        returned for XGBoost; models without categorical support get the CSR layout instead.
+        """
+        numeric = self.scaler.transform(X[NUMERIC_FEATURES])
+        codes = self._store_codes(X)
+
+        if self.mode == "categorical" and native:
+            encoded = pd.DataFrame(numeric, columns=NUMERIC_FEATURES, index=X.index)
+            encoded['Store'] = pd.Categorical.from_codes(codes, categories=self.stores)
+            return encoded
+
+        known = np.flatnonzero(codes >= 0)
+        indicators = sparse.csr_matrix(
+            (np.ones(len(known)), (known, codes[known])),
+            shape=(len(X), len(self.stores)),
+        )
+        return sparse.hstack([sparse.csr_matrix(numeric), indicators], format="csr")
+
+    def fit_transform(self, X, native=True):
+        return self.fit(X).transform(X, native=native)
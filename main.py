@@ -1,11 +1,37 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel, field_validator
 import pandas as pd
 import joblib
 from sqlalchemy import create_engine
 from mangum import Mangum
 import mlflow 
 from mlflow import MlflowClient
+from drift_monitor import DriftMonitor
+from prediction_log import PredictionLog
+
+# Store encoding the models were trained with: "onehot" (dense), "sparse" (CSR) or "categorical" (XGBoost native)
+STORE_ENCODING = os.getenv("STORE_ENCODING", "onehot")
+
+# Random Forest variant to serve: "full" or "compact" (size-budgeted variant logged by train.py)
+RF_VARIANT = os.getenv("RF_VARIANT", "full")
+rf_variant_suffix = "-compact" if RF_VARIANT == "compact" else ""
+
+# Largest number of input rows (stores x weeks) accepted by /predict_sales_horizon in one request
+HORIZON_MAX_ROWS = int(os.getenv("HORIZON_MAX_ROWS", "5000"))
+
+def registered_version_uri(name, run_id=None):
+    """Pin a registered model to a concrete version: the one logged by `run_id`, or the newest."""
+    filter_string = f"name='{name}'" + (f" and run_id='{run_id}'" if run_id else "")
+    versions = MlflowClient().search_model_versions(filter_string)
+    if not versions:
+        raise ValueError(f"No registered version of {name}" + (f" logged by training run {run_id}" if run_id else ""))
+    version = max(versions, key=lambda v: int(v.version))
+    return f"models:/{name}/{version.version}", version.run_id
 
 # Load the trained model
 # model = joblib.load('models/xgb_model-tuned.joblib')
@@ -18,9 +44,32 @@ try:
     mlflow.set_tracking_uri("http://127.0.0.1:5000")
     mlflow.set_experiment("Sales Forecasting Inference")
 
-    # Load models from local MLflow directories
-    model = mlflow.pyfunc.load_model("mlruns/models/XGB-Sales-Forecasting/version-2")
-    model_rf = mlflow.pyfunc.load_model("mlruns/models/RF-Sales-Forecasting/version-2")
+    if STORE_ENCODING == "onehot":
+        # Load models from local MLflow directories
+        xgb_model_uri = "mlruns/models/XGB-Sales-Forecasting/version-2"
+        model = mlflow.pyfunc.load_model(xgb_model_uri)
+        if RF_VARIANT == "compact":
+            # Compact Random Forest logged by the same training run as the served XGBoost model
+            rf_model_uri, _ = registered_version_uri("RF-Sales-Forecasting-compact", model.metadata.run_id)
+        else:
+            rf_model_uri = "mlruns/models/RF-Sales-Forecasting/version-2"
+        model_rf = mlflow.pyfunc.load_model(rf_model_uri)
+
+        # Log the training run behind each local model path rather than the path itself
+        xgb_model_version = f"runs:/{model.metadata.run_id}/{model.metadata.artifact_path}"
+        rf_model_version = (
+            rf_model_uri if RF_VARIANT == "compact"
+            else f"runs:/{model_rf.metadata.run_id}/{model_rf.metadata.artifact_path}"
+        )
+    else:
+        # Compact encodings take CSR/categorical input, so load the raw estimators without pyfunc schema enforcement.
+        # The Random Forest and store encoder are taken from the same training run as the newest XGBoost version.
+        xgb_model_uri, xgb_run_id = registered_version_uri(f"XGB-Sales-Forecasting-{STORE_ENCODING}")
+        rf_model_uri, _ = registered_version_uri(f"RF-Sales-Forecasting-{STORE_ENCODING}{rf_variant_suffix}", xgb_run_id)
+        store_encoder = joblib.load(mlflow.artifacts.download_artifacts(run_id=xgb_run_id, artifact_path="store_encoder.joblib"))
+        model = mlflow.sklearn.load_model(xgb_model_uri)
+        model_rf = mlflow.sklearn.load_model(rf_model_uri)
+        xgb_model_version, rf_model_version = xgb_model_uri, rf_model_uri
 except Exception as e:
     print(f"Error loading models: {str(e)}")
     raise e
@@ -28,6 +77,23 @@ except Exception as e:
 # Create a SQLite database connection
 engine = create_engine('sqlite:///walmart_sales.db')
 
+# Streaming drift statistics per store, restored from the last checkpoint on startup
+drift_monitor = DriftMonitor.from_files(
+    "models/drift_baseline.json",
+    "models/drift_checkpoint.json",
+    checkpoint_every=int(os.getenv("DRIFT_CHECKPOINT_EVERY", "100")),
+    checkpoint_seconds=int(os.getenv("DRIFT_CHECKPOINT_SECONDS", "300")),
+)
+
+# Append-only log of inference inputs, per-model outputs, model versions and latency in monthly partitions
+prediction_log = PredictionLog(
+    "sqlite:///prediction_log.db",
+    batch_size=int(os.getenv("PREDICTION_LOG_BATCH_SIZE", "50")),
+    flush_seconds=int(os.getenv("PREDICTION_LOG_FLUSH_SECONDS", "5")),
+    retention_months=int(os.getenv("PREDICTION_LOG_RETENTION_MONTHS", "0")) or None,
+    max_buffer_rows=int(os.getenv("PREDICTION_LOG_MAX_BUFFER_ROWS", "10000")),
+)
+
 # Define the input model using Pydantic
 class SalesInput(BaseModel):
     Store: int
@@ -38,63 +104,135 @@ class SalesInput(BaseModel):
     CPI: float
     Unemployment: float
 
-app = FastAPI()
+class ActualSales(BaseModel):
+    Store: int
+    Date: str
+    Weekly_Sales: float
+
+    @field_validator('Date')
+    @classmethod
+    def check_date(cls, value):
+        # Rejected with a 422 here rather than failing in iso_date
+        datetime.strptime(value, '%d-%m-%Y')
+        return value
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    # Persist in-process monitoring state and buffered prediction log rows on shutdown
+    drift_monitor.checkpoint()
+    prediction_log.flush()
+
+app = FastAPI(lifespan=lifespan)
 # handler = Mangum(app) # Convert FastAPI to AWS Lambda function
 
-def get_previous_sales(store):
-    # Query the database for the last two weeks of sales for the given store
+def get_previous_sales_batch(stores):
+    """Return {store: (previous week sales, two weeks ago sales)} for many stores in one query."""
+    store_list = ", ".join(str(int(store)) for store in stores)
     query = f"""
-    SELECT Date, Weekly_Sales
-    FROM walmart_sales
-    WHERE Store = {store}
-    LIMIT -2
+    SELECT Store, Weekly_Sales
+    FROM (
+        SELECT Store, Weekly_Sales, ROW_NUMBER() OVER (PARTITION BY Store ORDER BY rowid DESC) AS recency
+        FROM walmart_sales
+        WHERE Store IN ({store_list})
+    )
+    WHERE recency <= 2
+    ORDER BY Store, recency
     """
     store_sales = pd.read_sql(query, engine)
 
-    # Handle cases where there may not be enough data
-    previous_week_sales = store_sales.iloc[0]['Weekly_Sales'] if len(store_sales) > 0 else 0
-    two_weeks_ago_sales = store_sales.iloc[1]['Weekly_Sales'] if len(store_sales) > 1 else 0
-
-    return previous_week_sales, two_weeks_ago_sales
+    # Handle stores where there may not be enough data
+    previous_sales = {store: [0, 0] for store in stores}
+    for store, sales in store_sales.groupby('Store')['Weekly_Sales']:
+        previous_sales[store][:len(sales)] = sales.tolist()
+    return {store: tuple(sales) for store, sales in previous_sales.items()}
 
 # Function to apply feature engineering
 def apply_feature_engineering(input_data):
     # Convert input data to a DataFrame
     df = pd.DataFrame([input_data])
 
+    # Retrieve lagged sales data (the same lags that seed /predict_sales_horizon)
+    store = int(df['Store'][0])
+    df['Lag_1_Week_Sales'], df['Lag_2_Week_Sales'] = get_previous_sales_batch([store])[store]
+
+    return add_model_features(df)
+
+def add_model_features(df):
+    """Add date features and the store encoding to input rows that already carry lagged sales."""
     # Convert Date from string to datetime
     df['Date'] = pd.to_datetime(df['Date'], format='%d-%m-%Y')
 
-    # Retrieve lagged sales data
-    df['Lag_1_Week_Sales'], df['Lag_2_Week_Sales'] = get_previous_sales(df['Store'][0])
-
     # Extract date features (day of the week, month, week of the year)
     df['DayOfWeek'] = df['Date'].dt.dayofweek
     df['Month'] = df['Date'].dt.month
     df['WeekOfYear'] = df['Date'].dt.isocalendar().week
     df['Year'] = df['Date'].dt.year
 
+    if STORE_ENCODING != "onehot":
+        # Store is kept as a single column and encoded by the store encoder
+        return df.drop(columns=['Date'])
+
     for i in range(1, 46):
-        df[f'Store_{i}'] = 0
-    df[f'Store_{df["Store"].iloc[0]}'] = 1
+        df[f'Store_{i}'] = (df['Store'] == i).astype(int)
 
     df = df.drop(columns=['Date', 'Store'])
 
     return df
 
+def encode_features(input_features):
+    """Return the (XGBoost, Random Forest) model inputs for the configured store encoding."""
+    if STORE_ENCODING == "onehot":
+        return input_features, input_features
+    return store_encoder.transform(input_features), store_encoder.transform(input_features, native=False)
+
+def iso_date(date):
+    """Convert a 'dd-mm-yyyy' request date to an ISO date string."""
+    return datetime.strptime(date, '%d-%m-%Y').date().isoformat()
+
+def prediction_record(input_row, prediction_xgb, prediction_rf, ensemble_prediction, latency_ms, horizon_step=1):
+    """Build one prediction log row from an input row that carries its lagged sales."""
+    return {
+        "store": int(input_row["Store"]),
+        "sales_date": iso_date(input_row["Date"]),
+        "holiday_flag": int(input_row["Holiday_Flag"]),
+        "temperature": float(input_row["Temperature"]),
+        "fuel_price": float(input_row["Fuel_Price"]),
+        "cpi": float(input_row["CPI"]),
+        "unemployment": float(input_row["Unemployment"]),
+        "lag_1_week_sales": float(input_row["Lag_1_Week_Sales"]),
+        "lag_2_week_sales": float(input_row["Lag_2_Week_Sales"]),
+        "xgb_prediction": float(prediction_xgb),
+        "rf_prediction": float(prediction_rf),
+        "ensemble_prediction": float(ensemble_prediction),
+        "xgb_model": xgb_model_version,
+        "rf_model": rf_model_version,
+        "latency_ms": latency_ms,
+        "horizon_step": horizon_step,
+    }
+
 @app.post("/predict_sales")
 async def predict_sales(input_data: SalesInput):
+    start = time.perf_counter()
+
     # Convert the Pydantic input data to dictionary 
     input_dict = input_data.model_dump()
 
     # Apply feature engineering to get lagged features, date features, and one-hot encoded stores
     input_features = apply_feature_engineering(input_dict)
+    input_xgb, input_rf = encode_features(input_features)
 
     with mlflow.start_run(run_name="Inference Logs"):
         # Output sales predictions
-        prediction_xgb = model.predict(input_features)
-        prediction_rf = model_rf.predict(input_features)
+        prediction_xgb = model.predict(input_xgb)
+        prediction_rf = model_rf.predict(input_rf)
         ensemble_prediction = (prediction_xgb[0] + prediction_rf[0]) / 2
+        latency_ms = (time.perf_counter() - start) * 1000
+        drift_monitor.update(input_dict["Store"], {**input_dict, "ensemble_prediction": ensemble_prediction})
+        prediction_log.log(prediction_record(
+            {**input_dict, **input_features.iloc[0][['Lag_1_Week_Sales', 'Lag_2_Week_Sales']].to_dict()},
+            prediction_xgb[0], prediction_rf[0], ensemble_prediction, latency_ms,
+        ))
 
         # Log the predictions
         mlflow.log_metrics({
@@ -115,13 +253,77 @@ async def predict_sales(input_data: SalesInput):
         })
 
     # Insert row to SQL database with input_data and prediction
-    input_dict['Weekly_Sales'] = prediction
+    input_dict['Weekly_Sales'] = ensemble_prediction
     features = ['Store', 'Date', 'Weekly_Sales', 'Holiday_Flag', 'Temperature', 'Fuel_Price', 'CPI', 'Unemployment']
     df_input = pd.DataFrame([input_dict])[features]
     df_input.to_sql('walmart_sales', engine, if_exists='append', index=False)
     
     return {"prediction": round(ensemble_prediction, 2)}
 
+@app.post("/predict_sales_horizon")
+async def predict_sales_horizon(inputs: list[SalesInput]):
+    """
+    Recursively predict several future weeks for many stores with the XGBoost/Random Forest ensemble.
+    Each input row holds one store's covariates for one future week. All stores advance together one
+    week per step with a single batched predict per model, and the ensemble predictions are fed back
+    in as the lagged sales of the following week.
+    """
+    if len(inputs) > HORIZON_MAX_ROWS:
+        raise HTTPException(status_code=422, detail=f"At most {HORIZON_MAX_ROWS} input rows are accepted per request.")
+    covariates = pd.DataFrame([row.model_dump() for row in inputs], columns=list(SalesInput.model_fields))
+    if covariates.empty:
+        return {"predictions": []}
+
+    # Order each store's weeks by date and number them as forecast steps
+    try:
+        covariates['Week'] = pd.to_datetime(covariates['Date'], format='%d-%m-%Y')
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Date must be in dd-mm-yyyy format.")
+    covariates = covariates.sort_values(['Store', 'Week'], kind='stable')
+
+    # Predictions are only fed back as lags when each store's weeks are consecutive
+    gaps = covariates.groupby('Store')['Week'].diff().dropna()
+    if (gaps != pd.Timedelta(days=7)).any():
+        raise HTTPException(status_code=422, detail="Each store's dates must be consecutive weeks without duplicates.")
+    covariates['Step'] = covariates.groupby('Store').cumcount()
+    horizon = int(covariates['Step'].max()) + 1
+
+    # Seed the lags of every store from the database in one query
+    lags = get_previous_sales_batch(covariates['Store'].unique().tolist())
+
+    trajectory = []
+    with mlflow.start_run(run_name="Horizon Inference Logs"):
+        mlflow.log_params({"stores": len(lags), "horizon_weeks": horizon})
+
+        for step in range(horizon):
+            start = time.perf_counter()
+            step_rows = covariates[covariates['Step'] == step]
+            df = step_rows[list(SalesInput.model_fields)].reset_index(drop=True)
+            df['Lag_1_Week_Sales'] = [lags[store][0] for store in df['Store']]
+            df['Lag_2_Week_Sales'] = [lags[store][1] for store in df['Store']]
+
+            input_xgb, input_rf = encode_features(add_model_features(df.copy()))
+            predictions_xgb = model.predict(input_xgb)
+            predictions_rf = model_rf.predict(input_rf)
+            ensemble_predictions = (predictions_xgb + predictions_rf) / 2
+
+            # Latency of the batched step is shared evenly between its rows
+            latency_ms = (time.perf_counter() - start) * 1000 / len(df)
+
+            # Shift the lags forward with this week's predictions
+            for row, prediction_xgb, prediction_rf, prediction in zip(
+                df.to_dict(orient='records'), predictions_xgb, predictions_rf, ensemble_predictions
+            ):
+                store, date = row['Store'], row['Date']
+                drift_monitor.update(store, {**row, "ensemble_prediction": prediction})
+                prediction_log.log(prediction_record(row, prediction_xgb, prediction_rf, prediction, latency_ms, step + 1))
+                lags[store] = (float(prediction), lags[store][0])
+                trajectory.append({"Store": int(store), "Date": date, "Step": step + 1, "prediction": round(float(prediction), 2)})
+
+            mlflow.log_metric("mean_ensemble_prediction", float(ensemble_predictions.mean()), step=step + 1)
+
+    return {"predictions": sorted(trajectory, key=lambda row: (row["Store"], row["Step"]))}
+
 @app.post("/forecast_sales")
 async def predict_sales_arima(store_id: int, steps: int = 3):
 
@@ -179,6 +381,47 @@ async def monitor_mlflow(experiment_name: str):
         results.append(run_info)
     return results
 
+@app.post("/monitor_drift")
+async def monitor_drift(store: Optional[int] = None):
+    """Return running statistics and PSI drift scores of inference inputs and predictions against the training baseline."""
+    return drift_monitor.drift_report(store)
+
+@app.post("/record_actual_sales")
+async def record_actual_sales(actuals: list[ActualSales]):
+    """Record observed weekly sales so prediction errors can be aggregated from the prediction log."""
+    prediction_log.record_actuals([
+        {"store": actual.Store, "sales_date": iso_date(actual.Date), "weekly_sales": actual.Weekly_Sales}
+        for actual in actuals
+    ])
+    return {"recorded": len(actuals)}
+
+def time_window(start, end):
+    """Unix timestamps of a query window, defaulting to the last 7 days; naive datetimes are taken as UTC."""
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(days=7)
+    return tuple(
+        (moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)).timestamp()
+        for moment in (start, end)
+    )
+
+@app.post("/prediction_volume")
+async def prediction_volume(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                            bucket_hours: int = 24, store: Optional[int] = None):
+    """Prediction volume, mean prediction and latency per store and time bucket from the prediction log."""
+    if bucket_hours <= 0:
+        return {"error": "bucket_hours must be positive."}
+    return prediction_log.volume_by_store(*time_window(start, end), bucket_hours * 3600, store)
+
+@app.post("/prediction_errors")
+async def prediction_errors(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                            bucket_hours: int = 24, store: Optional[int] = None, horizon_step: int = 1):
+    """Ensemble and per-model error against recorded actual sales per store, forecast step and time bucket."""
+    if bucket_hours <= 0:
+        return {"error": "bucket_hours must be positive."}
+    if horizon_step < 0:
+        return {"error": "horizon_step must be positive, or 0 for every step."}
+    return prediction_log.error_by_store(*time_window(start, end), bucket_hours * 3600, store, horizon_step or None)
+
 # fastapi run main.py
 # uvicorn main:app --reload
 # mlflow server --backend-store-uri ./mlruns --host 127.0.0.1 --port 5000
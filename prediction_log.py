@@ -0,0 +1,215 @@
+import threading
+import time
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import SQLAlchemyError
+
+# Columns of each monthly prediction log partition (prediction_log_YYYYMM)
+PREDICTION_LOG_COLUMNS = {
+    'logged_at': 'REAL NOT NULL',  # Unix timestamp (UTC) of the request
+    'store': 'INTEGER NOT NULL',
+    'sales_date': 'TEXT NOT NULL',  # ISO date of the predicted week
+    'holiday_flag': 'INTEGER',
+    'temperature': 'REAL',
+    'fuel_price': 'REAL',
+    'cpi': 'REAL',
+    'unemployment': 'REAL',
+    'lag_1_week_sales': 'REAL',
+    'lag_2_week_sales': 'REAL',
+    'xgb_prediction': 'REAL',
+    'rf_prediction': 'REAL',
+    'ensemble_prediction': 'REAL',
+    'xgb_model': 'TEXT',
+    'rf_model': 'TEXT',
+    'latency_ms': 'REAL',
+    'horizon_step': 'INTEGER',  # Weeks ahead for multi-step forecasts; NULL or 1 for one-step predictions
+}
+
+def _partition(timestamp):
+    """Name of the monthly partition holding a Unix timestamp."""
+    return time.strftime("prediction_log_%Y%m", time.gmtime(timestamp))
+
+def _month_partitions(start, end):
+    """Names of every monthly partition overlapping [start, end)."""
+    months = pd.period_range(
+        datetime.fromtimestamp(start, timezone.utc).strftime("%Y-%m"),
+        datetime.fromtimestamp(max(start, end - 1), timezone.utc).strftime("%Y-%m"),
+        freq="M",
+    )
+    return [f"prediction_log_{month.strftime('%Y%m')}" for month in months]
+
+class PredictionLog:
+    """
+    Append-only SQLite log of inference inputs, per-model outputs, model versions and latency.
+    Rows are buffered and written with one batched insert every `batch_size` rows or `flush_seconds`,
+    into monthly partitions indexed by store and time. Aggregate queries only read the partitions that
+    overlap the requested time window, and partitions older than `retention_months` are dropped on rollover.
+    Failed writes are retried after `flush_seconds`, keeping at most the newest `max_buffer_rows` rows meanwhile.
+    """
+
+    def __init__(self, url="sqlite:///prediction_log.db", batch_size=50, flush_seconds=5, retention_months=None,
+                 max_buffer_rows=10000):
+        self.engine = create_engine(url)
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.retention_months = retention_months
+        self.max_buffer_rows = max_buffer_rows
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._retry_at = 0.0
+        self._partitions = set(self._existing_partitions())
+        self._lock = threading.Lock()
+
+        with self.engine.begin() as conn:
+            conn.execute(text("PRAGMA journal_mode=WAL"))
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS sales_actuals (
+                    store INTEGER NOT NULL,
+                    sales_date TEXT NOT NULL,
+                    weekly_sales REAL NOT NULL,
+                    PRIMARY KEY (store, sales_date)
+                )
+            """))
+            # Partitions created by an older schema get the columns added since
+            for table in self._partitions:
+                existing = {column['name'] for column in inspect(conn).get_columns(table)}
+                for name, column_type in PREDICTION_LOG_COLUMNS.items():
+                    if name not in existing:
+                        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}"))
+
+    def _existing_partitions(self):
+        return [name for name in inspect(self.engine).get_table_names() if name.startswith("prediction_log_")]
+
+    def _create_partition(self, conn, table):
+        columns = ", ".join(f"{name} {column_type}" for name, column_type in PREDICTION_LOG_COLUMNS.items())
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table} ({columns})"))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS idx_{table}_store_time ON {table} (store, logged_at)"))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS idx_{table}_time ON {table} (logged_at)"))
+        self._partitions.add(table)
+
+        # Roll over: drop partitions that fall outside the retention window
+        if self.retention_months:
+            oldest = sorted(self._partitions)[:-self.retention_months]
+            for old_table in oldest:
+                conn.execute(text(f"DROP TABLE IF EXISTS {old_table}"))
+                self._partitions.discard(old_table)
+
+    def log(self, record):
+        """Buffer one prediction record; `logged_at` defaults to now."""
+        record = {name: record.get(name) for name in PREDICTION_LOG_COLUMNS}
+        if record['logged_at'] is None:
+            record['logged_at'] = time.time()
+        with self._lock:
+            self._buffer.append(record)
+            if len(self._buffer) > self.max_buffer_rows:
+                # Writes keep failing: drop the oldest row rather than grow without bound
+                self._buffer.pop(0)
+            now = time.monotonic()
+            if now >= self._retry_at and (len(self._buffer) >= self.batch_size or now - self._last_flush >= self.flush_seconds):
+                self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            rows = pd.DataFrame(self._buffer)
+            columns = ", ".join(PREDICTION_LOG_COLUMNS)
+            values = ", ".join(f":{name}" for name in PREDICTION_LOG_COLUMNS)
+            partitions = set(self._partitions)
+            try:
+                with self.engine.begin() as conn:
+                    # One executemany per monthly partition touched by the batch
+                    for table, batch in rows.groupby(rows['logged_at'].map(_partition)):
+                        if table not in self._partitions:
+                            self._create_partition(conn, table)
+                        records = batch.astype(object).where(batch.notna(), None).to_dict(orient='records')
+                        conn.execute(text(f"INSERT INTO {table} ({columns}) VALUES ({values})"), records)
+            except SQLAlchemyError as e:
+                # Logging must never fail the prediction request; keep the buffer and retry after flush_seconds
+                print(f"Error writing prediction log: {str(e)}")
+                self._partitions = partitions
+                self._retry_at = time.monotonic() + self.flush_seconds
+                return
+        self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def record_actuals(self, actuals):
+        """Upsert observed weekly sales as dicts with store, sales_date (ISO) and weekly_sales."""
+        if not actuals:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+                INSERT OR REPLACE INTO sales_actuals (store, sales_date, weekly_sales)
+                VALUES (:store, :sales_date, :weekly_sales)
+            """), actuals)
+
+    def _window_query(self, select, start, end, store, horizon_step=None):
+        """UNION ALL of `select` over the existing partitions overlapping [start, end)."""
+        tables = [table for table in _month_partitions(start, end) if table in self._partitions]
+        store_filter = " AND store = :store" if store is not None else ""
+        if horizon_step is not None:
+            store_filter += " AND COALESCE(horizon_step, 1) = :horizon_step"
+        parts = [
+            f"SELECT {select} FROM {table} WHERE logged_at >= :start AND logged_at < :end{store_filter}"
+            for table in tables
+        ]
+        return " UNION ALL ".join(parts)
+
+    def volume_by_store(self, start, end, bucket_seconds=86400, store=None):
+        """Prediction volume, mean prediction and latency per store and time bucket within [start, end)."""
+        self.flush()
+        union = self._window_query(
+            f"store, CAST(logged_at / {int(bucket_seconds)} AS INTEGER) * {int(bucket_seconds)} AS bucket, ensemble_prediction, latency_ms",
+            start, end, store,
+        )
+        if not union:
+            return []
+        query = f"""
+        SELECT store, bucket, COUNT(*) AS predictions,
+               AVG(ensemble_prediction) AS mean_prediction, AVG(latency_ms) AS mean_latency_ms
+        FROM ({union})
+        GROUP BY store, bucket
+        ORDER BY store, bucket
+        """
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(query), {"start": start, "end": end, "store": store}).mappings().all()
+        return [self._with_bucket_time(row) for row in rows]
+
+    def error_by_store(self, start, end, bucket_seconds=86400, store=None, horizon_step=1):
+        """
+        Error of the ensemble and each model against recorded actual sales per store, forecast step and time bucket.
+        Only one-step predictions are included by default; pass `horizon_step=None` to break errors down by every step.
+        """
+        self.flush()
+        union = self._window_query(
+            f"store, sales_date, CAST(logged_at / {int(bucket_seconds)} AS INTEGER) * {int(bucket_seconds)} AS bucket, "
+            "COALESCE(horizon_step, 1) AS horizon_step, xgb_prediction, rf_prediction, ensemble_prediction",
+            start, end, store, horizon_step,
+        )
+        if not union:
+            return []
+        query = f"""
+        SELECT p.store, p.horizon_step, p.bucket, COUNT(*) AS predictions,
+               AVG(ABS(p.ensemble_prediction - a.weekly_sales)) AS mae,
+               AVG((p.ensemble_prediction - a.weekly_sales) * (p.ensemble_prediction - a.weekly_sales)) AS mse,
+               AVG(ABS(p.xgb_prediction - a.weekly_sales)) AS xgb_mae,
+               AVG(ABS(p.rf_prediction - a.weekly_sales)) AS rf_mae
+        FROM ({union}) AS p
+        JOIN sales_actuals AS a ON a.store = p.store AND a.sales_date = p.sales_date
+        GROUP BY p.store, p.horizon_step, p.bucket
+        ORDER BY p.store, p.horizon_step, p.bucket
+        """
+        with self.engine.connect() as conn:
+            params = {"start": start, "end": end, "store": store, "horizon_step": horizon_step}
+            rows = conn.execute(text(query), params).mappings().all()
+        return [{**self._with_bucket_time(row), "rmse": float(np.sqrt(row["mse"]))} for row in rows]
+
+    @staticmethod
+    def _with_bucket_time(row):
+        row = dict(row)
+        row["bucket"] = datetime.fromtimestamp(row["bucket"], timezone.utc).isoformat()
+        return row
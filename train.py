@@ -1,32 +1,42 @@
+import os
+import json
 import pandas as pd
-import numpy as np
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import MinMaxScaler
-from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 from xgboost import XGBRegressor
 from sklearn.ensemble import RandomForestRegressor
 import joblib
 import mlflow
 from mlflow.models import infer_signature
 from statsmodels.tsa.arima.model import ARIMA
+from features import engineer_features, StoreEncoder
+from evaluation import evaluate_model
+from drift_monitor import build_baseline
+from compact_forest import compact_random_forest, model_profile
+
+# Store encoding: "onehot" (dense, default), "sparse" (CSR) or "categorical" (XGBoost native)
+STORE_ENCODING = os.getenv("STORE_ENCODING", "onehot")
+
+# Compact the Random Forest after training (refits up to 9 extra forests, so it is opt-in)
+RF_COMPACT = os.getenv("RF_COMPACT", "false").lower() == "true"
+
+# Largest relative increase in held-out RMSE allowed when compacting the Random Forest
+RF_COMPACT_MAX_RMSE_INCREASE = float(os.getenv("RF_COMPACT_MAX_RMSE_INCREASE", "0.01"))
 
 # --- DATA LOADING ---
 data = pd.read_csv("data/Walmart_Sales.csv")
-data['Date'] = pd.to_datetime(data['Date'], format='%d-%m-%Y')
 
 # Feature engineering
-data['Lag_1_Week_Sales'] = data.groupby('Store')['Weekly_Sales'].shift(1)
-data['Lag_2_Week_Sales'] = data.groupby('Store')['Weekly_Sales'].shift(2)
-data['DayOfWeek'] = data['Date'].dt.dayofweek
-data['Month'] = data['Date'].dt.month
-data['WeekOfYear'] = data['Date'].dt.isocalendar().week
-data['Year'] = data['Date'].dt.year
+data = engineer_features(data)
 
-# Fill missing lagged sales values
-data.bfill(inplace=True)
+# Save drift monitoring baseline from the training rows (same unshuffled split as below)
+baseline_rows, _ = train_test_split(data, test_size=0.2, shuffle=False)
+with open("models/drift_baseline.json", "w") as f:
+    json.dump(build_baseline(baseline_rows), f)
 
-# One-hot encode Store column
-data = pd.get_dummies(data, columns=['Store'], drop_first=True)
+if STORE_ENCODING == "onehot":
+    # One-hot encode Store column
+    data = pd.get_dummies(data, columns=['Store'], drop_first=True)
 
 # Drop non-numeric and unused columns
 data = data.drop(columns=['Date'])
@@ -38,21 +48,28 @@ y = data['Weekly_Sales']
 X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, shuffle=False)
 
 # --- FEATURE SCALING ---
-scaler = MinMaxScaler()
-X_train = scaler.fit_transform(X_train)
-X_test = scaler.transform(X_test)
-
-# Save scaler for inference
-joblib.dump(scaler, "scaler.joblib") # /content/scaler.joblib
+if STORE_ENCODING == "onehot":
+    scaler = MinMaxScaler()
+    X_train = scaler.fit_transform(X_train)
+    X_test = scaler.transform(X_test)
+    X_train_rf, X_test_rf = X_train, X_test
+
+    # Save scaler for inference
+    joblib.dump(scaler, "scaler.joblib") # /content/scaler.joblib
+    model_suffix = ""
+else:
+    # Scale and encode stores compactly; Random Forest has no native categorical support so it gets CSR input
+    encoder = StoreEncoder(STORE_ENCODING).fit(X_train)
+    X_train_rf = encoder.transform(X_train, native=False)
+    X_test_rf = encoder.transform(X_test, native=False)
+    X_train = encoder.transform(X_train)
+    X_test = encoder.transform(X_test)
+
+    # Save encoder for inference
+    joblib.dump(encoder, "models/store_encoder.joblib")
+    model_suffix = f"-{STORE_ENCODING}"
 
 # --- MODEL TRAINING AND EVALUATION ---
-def evaluate_model(y_true, y_pred):
-    mae = mean_absolute_error(y_true, y_pred)
-    mse = mean_squared_error(y_true, y_pred)
-    rmse = np.sqrt(mse)
-    r2 = r2_score(y_true, y_pred)
-    return {"mae": mae, "mse": mse, "rmse": rmse, "r2": r2}
-
 # Set up MLflow experiment
 mlflow.set_tracking_uri("http://127.0.0.1:5000")  # Local MLflow server
 mlflow.set_experiment("Sales Forecasting Experiment")
@@ -61,7 +78,10 @@ mlflow.set_experiment("Sales Forecasting Experiment")
 with mlflow.start_run(run_name="Training Run"):
     # Log hyperparameters for XGBoost
     xgb_params = {'n_estimators': 100, 'random_state': 42}
+    if STORE_ENCODING == "categorical":
+        xgb_params.update({'tree_method': 'hist', 'enable_categorical': True})
     mlflow.log_params(xgb_params)
+    mlflow.log_param("store_encoding", STORE_ENCODING)
 
     # Train XGBoost model
     model_xgb = XGBRegressor(**xgb_params)
@@ -73,11 +93,11 @@ with mlflow.start_run(run_name="Training Run"):
 
     # Train Random Forest model
     model_rf = RandomForestRegressor(**rf_params)
-    model_rf.fit(X_train, y_train)
+    model_rf.fit(X_train_rf, y_train)
 
     # Evaluate both models
     xgboost_scores = evaluate_model(y_test, model_xgb.predict(X_test))
-    rf_scores = evaluate_model(y_test, model_rf.predict(X_test))
+    rf_scores = evaluate_model(y_test, model_rf.predict(X_test_rf))
 
     # Log evaluation metrics
     for metric, value in xgboost_scores.items():
@@ -86,38 +106,70 @@ with mlflow.start_run(run_name="Training Run"):
         mlflow.log_metric(f"rf_{metric}", value)
 
     # Log averaged final prediction metrics
-    final_predictions = (model_xgb.predict(X_test) + model_rf.predict(X_test)) / 2
+    final_predictions = (model_xgb.predict(X_test) + model_rf.predict(X_test_rf)) / 2
     final_metrics = evaluate_model(y_test, final_predictions)
     for metric, value in final_metrics.items():
         mlflow.log_metric(f"final_{metric}", value)
 
     # Log the trained models as MLflow artifacts
-    xgb_signature = infer_signature(X_train, model_xgb.predict(X_train))
+    # Compact encodings are served with mlflow.sklearn, so no pyfunc signature is inferred for them
+    dense = STORE_ENCODING == "onehot"
+    xgb_signature = infer_signature(X_train, model_xgb.predict(X_train)) if dense else None
     mlflow.sklearn.log_model(
         sk_model=model_xgb,
         artifact_path="xgboost_model",
-        registered_model_name="XGB-Sales-Forecasting",
+        registered_model_name=f"XGB-Sales-Forecasting{model_suffix}",
         signature=xgb_signature,
-        input_example=X_train,
+        input_example=X_train if dense else None,
     )
 
-    rf_signature = infer_signature(X_train, model_rf.predict(X_train))
+    rf_signature = infer_signature(X_train_rf, model_rf.predict(X_train_rf)) if dense else None
     mlflow.sklearn.log_model(
         sk_model=model_rf,
         artifact_path="randomforest_model",
-        registered_model_name="RF-Sales-Forecasting",
+        registered_model_name=f"RF-Sales-Forecasting{model_suffix}",
         signature=rf_signature,
-        input_example=X_train,
+        input_example=X_train_rf if dense else None,
     )
 
+    if RF_COMPACT:
+        # Compact the Random Forest within the accuracy budget and log both variants for comparison
+        model_rf_compact = compact_random_forest(
+            model_rf, X_train_rf, y_train, X_test_rf, y_test, max_rmse_increase=RF_COMPACT_MAX_RMSE_INCREASE
+        )
+        mlflow.log_params({
+            "rf_compact_max_rmse_increase": RF_COMPACT_MAX_RMSE_INCREASE,
+            "rf_compact_n_estimators": model_rf_compact.n_estimators,
+            "rf_compact_max_depth": model_rf_compact.max_depth,
+            "rf_compact_min_samples_leaf": model_rf_compact.min_samples_leaf,
+        })
+
+        rf_full_profile = model_profile(model_rf, X_test_rf, y_test)
+        rf_compact_profile = model_profile(model_rf_compact, X_test_rf, y_test)
+        for metric, value in rf_full_profile.items():
+            mlflow.log_metric(f"rf_full_{metric}", value)
+        for metric, value in rf_compact_profile.items():
+            mlflow.log_metric(f"rf_compact_{metric}", value)
+            mlflow.log_metric(f"rf_compact_{metric}_delta", value - rf_full_profile[metric])
+
+        rf_compact_signature = infer_signature(X_train_rf, model_rf_compact.predict(X_train_rf)) if dense else None
+        mlflow.sklearn.log_model(
+            sk_model=model_rf_compact,
+            artifact_path="randomforest_compact_model",
+            registered_model_name=f"RF-Sales-Forecasting{model_suffix}-compact",
+            signature=rf_compact_signature,
+            input_example=X_train_rf if dense else None,
+        )
+
     # Log feature scaling or transformation
-    mlflow.log_artifact("models/scaler.joblib")
+    mlflow.log_artifact("models/scaler.joblib" if dense else "models/store_encoder.joblib")
+    mlflow.log_artifact("models/drift_baseline.json")
 
     # Save raw predictions to a DataFrame
     predictions_df = pd.DataFrame({
         "True Values": y_test.tolist(),
         "XGBoost Predictions": model_xgb.predict(X_test).tolist(),
-        "Random Forest Predictions": model_rf.predict(X_test).tolist(),
+        "Random Forest Predictions": model_rf.predict(X_test_rf).tolist(),
         "Final Predictions (Averaged)": final_predictions.tolist()
     })
 
@@ -0,0 +1,207 @@
+import argparse
+import os
+import resource
+import tempfile
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from xgboost import XGBRegressor
+from sklearn.ensemble import RandomForestRegressor
+import joblib
+import mlflow
+from features import iter_engineered_chunks, StoreEncoder
+from evaluation import StreamingMetrics
+
+# Out-of-core variant of train.py for sales histories that do not fit in memory.
+# The CSV is streamed in chunks on every pass, so peak RSS depends on the chunk size rather than the dataset size:
+#   1. count rows to place the same 80/20 unshuffled split as train.py
+#   2. fit the MinMaxScaler and store set incrementally with partial_fit, and draw a bounded uniform
+#      reservoir sample of the training rows for the Random Forest
+#   3. train XGBoost from a data iterator into an external-memory DMatrix cached on disk
+#   4. fit the Random Forest on the reservoir sample (sklearn forests cannot train out of core)
+#   5. evaluate and write predictions chunk by chunk
+# Models and predictions are written under separate "-out-of-core" names so this script never replaces the outputs of train.py.
+
+# Store encoding (see features.py); categorical keeps one Store column per chunk
+STORE_ENCODING = os.getenv("STORE_ENCODING", "categorical")
+if STORE_ENCODING == "onehot":
+    raise ValueError("Out-of-core training needs a compact store encoding: 'sparse' or 'categorical'")
+
+parser = argparse.ArgumentParser(description="Out-of-core training of the XGBoost/Random Forest ensemble")
+parser.add_argument("--data", default="data/Walmart_Sales.csv", help="Raw sales CSV, in date order within each store")
+parser.add_argument("--chunksize", type=int, default=100_000, help="Rows per chunk")
+parser.add_argument("--rf-sample-rows", type=int, default=200_000, help="Training rows sampled for the Random Forest")
+args = parser.parse_args()
+
+def iter_split(part, n_train):
+    """Yield (features, target) chunks of the train or test part of the unshuffled split."""
+    offset = 0
+    for chunk in iter_engineered_chunks(args.data, args.chunksize):
+        start = offset
+        offset += len(chunk)
+        cut = min(max(n_train - start, 0), len(chunk))
+        rows = chunk.iloc[:cut] if part == "train" else chunk.iloc[cut:]
+        if len(rows):
+            yield rows.drop(columns=['Date', 'Weekly_Sales']), rows['Weekly_Sales']
+
+class SalesChunkIter(xgb.DataIter):
+    """Feed encoded training chunks to XGBoost's external-memory DMatrix."""
+
+    def __init__(self, encoder, n_train, cache_dir):
+        self.encoder = encoder
+        self.n_train = n_train
+        self._chunks = None
+        super().__init__(cache_prefix=os.path.join(cache_dir, "xgb"))
+
+    def next(self, input_data):
+        if self._chunks is None:
+            self._chunks = iter_split("train", self.n_train)
+        try:
+            X, y = next(self._chunks)
+        except StopIteration:
+            return False
+        input_data(data=self.encoder.transform(X), label=y)
+        return True
+
+    def reset(self):
+        self._chunks = None
+
+class Reservoir:
+    """Uniform random sample of at most `size` rows from a stream of chunks (reservoir sampling)."""
+
+    def __init__(self, size, seed=42):
+        self.size = size
+        self.rng = np.random.default_rng(seed)
+        self.seen = 0
+        self.rows = None
+
+    def add(self, X, y):
+        chunk = X.assign(Weekly_Sales=y.to_numpy()).reset_index(drop=True)
+        if self.rows is None:
+            self.rows = chunk.iloc[:0]
+
+        # Fill the reservoir first
+        free = min(max(self.size - len(self.rows), 0), len(chunk))
+        self.rows = pd.concat([self.rows, chunk.iloc[:free]], ignore_index=True)
+        rest = chunk.iloc[free:]
+        self.seen += free
+
+        # Row number i (0-based) replaces a random slot with probability size / (i + 1)
+        slots = self.rng.integers(0, self.seen + np.arange(len(rest)) + 1)
+        keep = slots < self.size
+        # When several rows of the chunk hit the same slot the last one wins
+        replacements = pd.Series(np.flatnonzero(keep), index=slots[keep])
+        replacements = replacements[~replacements.index.duplicated(keep='last')]
+        self.rows = pd.concat(
+            [self.rows.drop(index=replacements.index), rest.iloc[replacements.to_numpy()]],
+            ignore_index=True,
+        )
+        self.seen += len(rest)
+
+    def sample(self):
+        return self.rows.drop(columns=['Weekly_Sales']), self.rows['Weekly_Sales']
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+# --- TRAIN-TEST SPLIT ---
+n_rows = sum(len(chunk) for chunk in pd.read_csv(args.data, usecols=['Store'], chunksize=args.chunksize))
+n_test = -(-n_rows * 2 // 10)  # Same rounding as train_test_split(test_size=0.2)
+n_train = n_rows - n_test
+
+# --- FEATURE SCALING AND RANDOM FOREST SAMPLE ---
+encoder = StoreEncoder(STORE_ENCODING)
+reservoir = Reservoir(args.rf_sample_rows)
+for X_chunk, y_chunk in iter_split("train", n_train):
+    encoder.partial_fit(X_chunk)
+    reservoir.add(X_chunk, y_chunk)
+
+# Save encoder for inference
+encoder_path = "models/store_encoder_out_of_core.joblib"
+joblib.dump(encoder, encoder_path)
+
+# Set up MLflow experiment
+mlflow.set_tracking_uri("http://127.0.0.1:5000")  # Local MLflow server
+mlflow.set_experiment("Sales Forecasting Experiment")
+
+with mlflow.start_run(run_name="Out-of-Core Training Run"):
+    mlflow.log_params({
+        "store_encoding": STORE_ENCODING,
+        "chunksize": args.chunksize,
+        "train_rows": n_train,
+        "test_rows": n_test,
+    })
+
+    # --- XGBOOST (EXTERNAL MEMORY) ---
+    xgb_params = {'tree_method': 'hist', 'seed': 42}
+    mlflow.log_params(xgb_params)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        dtrain = xgb.ExtMemQuantileDMatrix(
+            SalesChunkIter(encoder, n_train, cache_dir),
+            enable_categorical=STORE_ENCODING == "categorical",
+        )
+        booster = xgb.train(xgb_params, dtrain, num_boost_round=100)
+        del dtrain
+
+    # Wrap the booster in the sklearn estimator used by train.py and the serving path
+    booster.save_model("models/xgb_model_out_of_core.ubj")
+    model_xgb = XGBRegressor(enable_categorical=STORE_ENCODING == "categorical")
+    model_xgb.load_model("models/xgb_model_out_of_core.ubj")
+
+    # --- RANDOM FOREST (RESERVOIR SAMPLE) ---
+    # Sampled uniformly across all chunks, so every tree sees every store even when the CSV is sorted by store
+    rf_params = {'n_estimators': 100, 'random_state': 42}
+    mlflow.log_params(rf_params)
+    X_sample, y_sample = reservoir.sample()
+    mlflow.log_param("rf_sample_rows", len(X_sample))
+    model_rf = RandomForestRegressor(**rf_params)
+    model_rf.fit(encoder.transform(X_sample, native=False), y_sample)
+    del reservoir, X_sample, y_sample
+
+    # --- CHUNKED EVALUATION ---
+    xgboost_scores, rf_scores, final_scores = StreamingMetrics(), StreamingMetrics(), StreamingMetrics()
+    predictions_path = "data/predictions_out_of_core.csv"
+    if os.path.exists(predictions_path):
+        os.remove(predictions_path)
+
+    for X_chunk, y_chunk in iter_split("test", n_train):
+        prediction_xgb = model_xgb.predict(encoder.transform(X_chunk))
+        prediction_rf = model_rf.predict(encoder.transform(X_chunk, native=False))
+        final_predictions = (prediction_xgb + prediction_rf) / 2
+
+        xgboost_scores.update(y_chunk, prediction_xgb)
+        rf_scores.update(y_chunk, prediction_rf)
+        final_scores.update(y_chunk, final_predictions)
+
+        # Append raw predictions to the CSV file
+        pd.DataFrame({
+            "True Values": y_chunk.tolist(),
+            "XGBoost Predictions": prediction_xgb.tolist(),
+            "Random Forest Predictions": prediction_rf.tolist(),
+            "Final Predictions (Averaged)": final_predictions.tolist()
+        }).to_csv(predictions_path, mode="a", header=not os.path.exists(predictions_path), index=False)
+
+    # Log evaluation metrics
+    for prefix, scores in (("xgboost", xgboost_scores), ("rf", rf_scores), ("final", final_scores)):
+        for metric, value in scores.result().items():
+            mlflow.log_metric(f"{prefix}_{metric}", value)
+    mlflow.log_metric("peak_rss_mb", peak_rss_mb())
+
+    # Log the trained models under their own registered names, separate from the models served by main.py
+    mlflow.sklearn.log_model(
+        sk_model=model_xgb,
+        artifact_path="xgboost_model",
+        registered_model_name=f"XGB-Sales-Forecasting-{STORE_ENCODING}-out-of-core",
+    )
+    mlflow.sklearn.log_model(
+        sk_model=model_rf,
+        artifact_path="randomforest_model",
+        registered_model_name=f"RF-Sales-Forecasting-{STORE_ENCODING}-out-of-core",
+    )
+
+    # Log the store encoder and predictions
+    mlflow.log_artifact(encoder_path)
+    mlflow.log_artifact(predictions_path, artifact_path="predictions")
+
+print(f"Out-of-core training completed. Peak RSS: {peak_rss_mb():.1f} MB")
@@ -1,7 +1,19 @@
+import json
+import time
+import pickle
 import pytest
 from fastapi.testclient import TestClient
 from main import app
 from unittest.mock import patch, MagicMock
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from compact_forest import compact_random_forest
+from drift_monitor import build_baseline, DriftMonitor
+from prediction_log import PredictionLog
+from features import engineer_features, iter_engineered_chunks, StoreEncoder, NUMERIC_FEATURES
 
 # Create a test client for FastAPI
 client = TestClient(app)
@@ -133,4 +145,333 @@ def test_predict_sales_arima_invalid_steps():
     # Assertions to verify the response
     assert response.status_code == 422  # Unprocessable Entity due to validation error
 
+def test_store_encoder_compact_layouts():
+    """
+    Test that the compact store encodings keep one indicator per known store and ignore unseen stores.
+    """
+    X = pd.DataFrame({feature: [1.0, 2.0, 3.0] for feature in NUMERIC_FEATURES})
+    X['Store'] = [1, 2, 3]
+    unseen = X.assign(Store=[1, 99, 3])
+
+    sparse_encoder = StoreEncoder("sparse").fit(X)
+    encoded = sparse_encoder.transform(unseen)
+    assert encoded.shape == (3, len(NUMERIC_FEATURES) + 3)
+    assert encoded[:, len(NUMERIC_FEATURES):].sum() == 2  # Unseen store has no indicator set
+
+    categorical_encoder = StoreEncoder("categorical").fit(X)
+    encoded = categorical_encoder.transform(unseen)
+    assert str(encoded['Store'].dtype) == "category"
+    assert encoded['Store'].isna().sum() == 1
+
+def test_engineered_chunks_match_in_memory_features(tmp_path):
+    """
+    Test that lags streamed across chunk boundaries match the in-memory feature engineering.
+    """
+    raw = pd.DataFrame({
+        "Store": [1] * 5 + [2] * 5,
+        "Date": [f"{day:02d}-01-2022" for day in range(1, 30, 7)] * 2,
+        "Weekly_Sales": [float(value) for value in range(10, 20)],
+        "Holiday_Flag": 0,
+        "Temperature": 20.0,
+        "Fuel_Price": 2.0,
+        "CPI": 100.0,
+        "Unemployment": 5.0
+    })
+    path = tmp_path / "sales.csv"
+    raw.to_csv(path, index=False)
+
+    expected = engineer_features(raw.copy())
+    streamed = pd.concat(iter_engineered_chunks(path, chunksize=3), ignore_index=True)
+
+    for column in ['Lag_1_Week_Sales', 'Lag_2_Week_Sales']:
+        assert streamed[column].tolist() == expected[column].tolist()
+
+@patch("main.get_previous_sales_batch", return_value={1: (100.0, 90.0), 2: (200.0, 180.0)})
+@patch("main.model_rf")
+@patch("main.model")
+@patch("main.mlflow")
+def test_predict_sales_horizon(mock_mlflow, mock_model, mock_model_rf, mock_previous_sales):
+    """
+    Test the /predict_sales_horizon endpoint advances all stores together with one batched predict per step.
+    """
+    mock_mlflow.start_run.return_value = MagicMock()
+    mock_model.predict.side_effect = lambda X: np.full(len(X), 10.0)
+    mock_model_rf.predict.side_effect = lambda X: np.full(len(X), 20.0)
+
+    # Two stores with three future weeks each, deliberately out of date order
+    input_data = [
+        {
+            "Store": store,
+            "Date": date,
+            "Holiday_Flag": 0,
+            "Temperature": 20.0,
+            "Fuel_Price": 2.0,
+            "CPI": 100.0,
+            "Unemployment": 5.0
+        }
+        for store in (2, 1) for date in ("15-01-2022", "01-01-2022", "08-01-2022")
+    ]
+
+    response = client.post("/predict_sales_horizon", json=input_data)
+
+    assert response.status_code == 200
+    predictions = response.json()["predictions"]
+    assert len(predictions) == 6
+    assert [row["Date"] for row in predictions[:3]] == ["01-01-2022", "08-01-2022", "15-01-2022"]
+    assert all(row["prediction"] == 15.0 for row in predictions)
+
+    # One batched predict per model per step, with the previous step's ensemble prediction as Lag 1
+    assert mock_model.predict.call_count == 3
+    second_step = mock_model.predict.call_args_list[1][0][0]
+    assert len(second_step) == 2
+    assert second_step['Lag_1_Week_Sales'].tolist() == [15.0, 15.0]
+    assert sorted(second_step['Lag_2_Week_Sales'].tolist()) == [100.0, 200.0]
+
+@pytest.mark.parametrize("dates", [
+    ("01-01-2022", "01-01-2022", "08-01-2022"),  # Duplicate week
+    ("01-01-2022", "01-06-2022"),  # Gap between weeks
+    ("2022-01-01",),  # Wrong date format
+])
+@patch("main.get_previous_sales_batch", return_value={1: (100.0, 90.0)})
+@patch("main.model")
+def test_predict_sales_horizon_rejects_non_consecutive_weeks(mock_model, mock_previous_sales, dates):
+    """
+    Test the /predict_sales_horizon endpoint rejects dates that cannot be forecast recursively, before predicting.
+    """
+    input_data = [
+        {"Store": 1, "Date": date, "Holiday_Flag": 0, "Temperature": 20.0, "Fuel_Price": 2.0, "CPI": 100.0, "Unemployment": 5.0}
+        for date in dates
+    ]
+
+    response = client.post("/predict_sales_horizon", json=input_data)
+
+    assert response.status_code == 422
+    mock_model.predict.assert_not_called()
+
+@patch("main.HORIZON_MAX_ROWS", 2)
+def test_predict_sales_horizon_limits_input_rows():
+    """
+    Test the /predict_sales_horizon endpoint rejects requests with more rows than HORIZON_MAX_ROWS.
+    """
+    input_data = [
+        {"Store": store, "Date": "01-01-2022", "Holiday_Flag": 0, "Temperature": 20.0, "Fuel_Price": 2.0, "CPI": 100.0, "Unemployment": 5.0}
+        for store in (1, 2, 3)
+    ]
+
+    response = client.post("/predict_sales_horizon", json=input_data)
+
+    assert response.status_code == 422
+
+def test_drift_monitor_statistics_and_checkpoint(tmp_path):
+    """
+    Test the running statistics, PSI against the training baseline and checkpoint restore of the drift monitor.
+    """
+    training = pd.DataFrame({
+        "Store": [1] * 100,
+        "Temperature": np.linspace(0, 100, 100),
+        "Fuel_Price": 2.0,
+        "CPI": 100.0,
+        "Unemployment": 5.0,
+        "Weekly_Sales": np.linspace(1000, 2000, 100)
+    })
+    checkpoint_path = tmp_path / "drift_checkpoint.json"
+    monitor = DriftMonitor(build_baseline(training), str(checkpoint_path), checkpoint_every=2)
+
+    for temperature in (10.0, 20.0, 30.0, 40.0):
+        monitor.update(1, {"Temperature": temperature, "Fuel_Price": 2.0, "CPI": 100.0, "Unemployment": 5.0, "ensemble_prediction": 1500.0})
+
+    report = monitor.drift_report(1)["1"]
+    assert report["Temperature"]["count"] == 4
+    assert report["Temperature"]["mean"] == pytest.approx(25.0)
+    assert report["Temperature"]["std"] == pytest.approx(np.std([10.0, 20.0, 30.0, 40.0]))
+    assert report["Temperature"]["psi"] > 0.2  # Only the lower half of the baseline range is observed
+
+    restored = DriftMonitor.from_files(str(tmp_path / "missing_baseline.json"), str(checkpoint_path))
+    assert restored.drift_report(1)["1"]["Temperature"]["count"] == 4
+
+def test_drift_monitor_rebaseline_and_unwritable_checkpoint(tmp_path):
+    """
+    Test that histograms restored from a checkpoint are rebinned when the baseline changes, and that a failing
+    checkpoint write does not raise into the prediction request.
+    """
+    def training(bins_source):
+        return pd.DataFrame({
+            "Store": [1] * len(bins_source),
+            "Temperature": bins_source,
+            "Fuel_Price": 2.0,
+            "CPI": 100.0,
+            "Unemployment": 5.0,
+            "Weekly_Sales": 1000.0
+        })
+
+    values = {"Temperature": 10.0, "Fuel_Price": 2.0, "CPI": 100.0, "Unemployment": 5.0, "ensemble_prediction": 1000.0}
+    checkpoint_path = tmp_path / "drift_checkpoint.json"
+    monitor = DriftMonitor(build_baseline(training(np.linspace(0, 100, 100))), str(checkpoint_path), checkpoint_every=1)
+    monitor.update(1, values)
+
+    # Retrained baseline with a different number of distinct bin edges
+    retrained_path = tmp_path / "drift_baseline.json"
+    retrained_path.write_text(json.dumps(build_baseline(training([0.0, 50.0] * 50))))
+    restored = DriftMonitor.from_files(str(retrained_path), str(checkpoint_path))
+    report = restored.drift_report(1)["1"]["Temperature"]
+    assert report["count"] == 1
+    assert report["psi"] is None  # Histogram restarted on the new edges
+    restored.update(1, values)
+    assert restored.drift_report(1)["1"]["Temperature"]["psi"] is not None
+
+    unwritable = DriftMonitor(checkpoint_path=str(tmp_path / "missing_dir" / "drift_checkpoint.json"), checkpoint_every=1)
+    unwritable.update(1, values)
+    assert unwritable.drift_report(1)["1"]["Temperature"]["count"] == 1
+
+@patch("main.drift_monitor")
+def test_monitor_drift(mock_drift_monitor):
+    """
+    Test the /monitor_drift endpoint returns the drift report for the requested store.
+    """
+    mock_drift_monitor.drift_report.return_value = {"1": {"Temperature": {"count": 1, "psi": 0.0}}}
+
+    response = client.post("/monitor_drift?store=1")
+
+    assert response.status_code == 200
+    assert response.json()["1"]["Temperature"]["count"] == 1
+    mock_drift_monitor.drift_report.assert_called_once_with(1)
+
+def test_compact_random_forest_respects_accuracy_budget():
+    """
+    Test that under a loose RMSE budget the compacted Random Forest is strictly smaller than the original and stays within the budget.
+    """
+    rng = np.random.default_rng(42)
+    X = rng.uniform(size=(300, 4))
+    y = 100 * X[:, 0] + 10 * X[:, 1] + rng.normal(scale=1.0, size=300)
+    X_train, X_val, y_train, y_val = X[:240], X[240:], y[:240], y[240:]
+
+    model_rf = RandomForestRegressor(n_estimators=30, random_state=42).fit(X_train, y_train)
+    compact = compact_random_forest(model_rf, X_train, y_train, X_val, y_val, max_rmse_increase=0.5)
+
+    full_rmse = np.sqrt(np.mean((model_rf.predict(X_val) - y_val) ** 2))
+    compact_rmse = np.sqrt(np.mean((compact.predict(X_val) - y_val) ** 2))
+    assert compact_rmse <= full_rmse * 1.5
+    assert compact is not model_rf
+    assert len(pickle.dumps(compact)) < len(pickle.dumps(model_rf))
+    assert sum(tree.tree_.node_count for tree in compact.estimators_) < sum(tree.tree_.node_count for tree in model_rf.estimators_)
+
+def test_prediction_log_partitions_and_aggregates(tmp_path):
+    """
+    Test batched inserts into monthly partitions, retention rollover and the per-store aggregates of the prediction log.
+    """
+    prediction_log = PredictionLog(f"sqlite:///{tmp_path / 'prediction_log.db'}", batch_size=10, retention_months=2)
+    january, february, march = 1704067200.0, 1706745600.0, 1709251200.0  # 1st of each month 2024 (UTC)
+
+    for logged_at in (january, february, march, march + 60):
+        prediction_log.log({
+            "logged_at": logged_at,
+            "store": 1,
+            "sales_date": "2024-03-01",
+            "xgb_prediction": 90.0,
+            "rf_prediction": 110.0,
+            "ensemble_prediction": 100.0,
+            "latency_ms": 5.0
+        })
+    prediction_log.record_actuals([{"store": 1, "sales_date": "2024-03-01", "weekly_sales": 120.0}])
+
+    # The January partition is rolled over when March is created
+    volume = prediction_log.volume_by_store(january, march + 3600, bucket_seconds=86400)
+    assert [(row["bucket"][:10], row["predictions"]) for row in volume] == [("2024-02-01", 1), ("2024-03-01", 2)]
+
+    # A two-week-ahead forecast of the same week is kept apart from the one-step errors
+    prediction_log.log({
+        "logged_at": march + 120,
+        "store": 1,
+        "sales_date": "2024-03-01",
+        "xgb_prediction": 60.0,
+        "rf_prediction": 80.0,
+        "ensemble_prediction": 70.0,
+        "latency_ms": 5.0,
+        "horizon_step": 2
+    })
+
+    errors = prediction_log.error_by_store(march, march + 3600, store=1)
+    assert len(errors) == 1
+    assert errors[0]["predictions"] == 2
+    assert errors[0]["mae"] == pytest.approx(20.0)
+    assert errors[0]["xgb_mae"] == pytest.approx(30.0)
+
+    by_step = prediction_log.error_by_store(march, march + 3600, store=1, horizon_step=None)
+    assert [(row["horizon_step"], row["mae"]) for row in by_step] == [(1, pytest.approx(20.0)), (2, pytest.approx(50.0))]
+
+def test_prediction_log_migrates_old_partitions(tmp_path):
+    """
+    Test that partitions written before a column was added are migrated and still queryable.
+    """
+    url = f"sqlite:///{tmp_path / 'prediction_log.db'}"
+    prediction_log = PredictionLog(url)
+    with prediction_log.engine.begin() as conn:
+        conn.execute(text("CREATE TABLE prediction_log_202403 (logged_at REAL NOT NULL, store INTEGER NOT NULL, sales_date TEXT NOT NULL, ensemble_prediction REAL)"))
+        conn.execute(text("INSERT INTO prediction_log_202403 VALUES (1709251200.0, 1, '2024-03-01', 100.0)"))
+
+    prediction_log = PredictionLog(url, batch_size=1)
+    prediction_log.log({"logged_at": 1709251260.0, "store": 1, "sales_date": "2024-03-01", "ensemble_prediction": 100.0, "horizon_step": 1})
+    volume = prediction_log.volume_by_store(1709251200.0, 1709254800.0)
+    assert volume[0]["predictions"] == 2
+
+@patch("main.prediction_log")
+@patch("main.drift_monitor")
+def test_shutdown_flushes_monitoring_state(mock_drift_monitor, mock_prediction_log):
+    """
+    Test that stopping the app checkpoints the drift monitor and flushes the buffered prediction log.
+    """
+    with TestClient(app):
+        pass
+    mock_drift_monitor.checkpoint.assert_called_once()
+    mock_prediction_log.flush.assert_called_once()
+
+def test_prediction_log_survives_write_errors(tmp_path):
+    """
+    Test that a failed batch insert is reported instead of raised, retried later and bounded in size.
+    """
+    prediction_log = PredictionLog(f"sqlite:///{tmp_path / 'prediction_log.db'}", batch_size=1, flush_seconds=0, max_buffer_rows=3)
+    record = {"store": 1, "sales_date": "2024-03-01", "ensemble_prediction": 100.0}
+
+    with patch.object(prediction_log.engine, "begin", side_effect=OperationalError("INSERT", {}, Exception("database is locked"))):
+        for _ in range(5):
+            prediction_log.log(record)
+    assert len(prediction_log._buffer) == 3
+
+    prediction_log.log(record)
+    assert prediction_log._buffer == []
+    assert sum(row["predictions"] for row in prediction_log.volume_by_store(0, time.time() + 1)) == 3
+
+@patch("main.prediction_log")
+def test_record_actual_sales_validation(mock_prediction_log):
+    """
+    Test the /record_actual_sales endpoint accepts an empty body and rejects dates that are not dd-mm-yyyy.
+    """
+    response = client.post("/record_actual_sales", json=[])
+    assert response.status_code == 200
+    assert response.json() == {"recorded": 0}
+
+    response = client.post("/record_actual_sales", json=[{"Store": 1, "Date": "2024-03-01", "Weekly_Sales": 120.0}])
+    assert response.status_code == 422
+    mock_prediction_log.record_actuals.assert_called_once_with([])
+
+def test_prediction_log_ignores_empty_actuals(tmp_path):
+    """
+    Test that recording an empty list of actual sales is a no-op.
+    """
+    prediction_log = PredictionLog(f"sqlite:///{tmp_path / 'prediction_log.db'}")
+    prediction_log.record_actuals([])
+
+@patch("main.prediction_log")
+def test_prediction_volume(mock_prediction_log):
+    """
+    Test the /prediction_volume endpoint queries the prediction log for the requested window and store.
+    """
+    mock_prediction_log.volume_by_store.return_value = [{"store": 1, "bucket": "2024-03-01T00:00:00+00:00", "predictions": 2}]
+
+    response = client.post("/prediction_volume?start=2024-03-01T00:00:00&end=2024-03-02T00:00:00&bucket_hours=1&store=1")
+
+    assert response.status_code == 200
+    assert response.json()[0]["predictions"] == 2
+    mock_prediction_log.volume_by_store.assert_called_once_with(1709251200.0, 1709337600.0, 3600, 1)
+
 # Command to run tests: `pytest tests/unit_tests.py`